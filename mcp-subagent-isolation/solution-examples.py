@@ -5,18 +5,262 @@ This file demonstrates practical workarounds for isolating MCP servers
 to specific agents in Claude Code SDK.
 """
 
+import contextlib
+import functools
+import json
+import math
+import re
+import uuid
+from collections import defaultdict
+from collections.abc import AsyncIterator, Mapping
+from contextlib import AbstractAsyncContextManager, AsyncExitStack, asynccontextmanager
+from types import MappingProxyType
+from typing import ClassVar
+
 import anyio
+from anyio.streams.memory import MemoryObjectReceiveStream, MemoryObjectSendStream
 from claude_agent_sdk import (
     ClaudeAgentOptions,
     ClaudeSDKClient,
+    Message,
     tool,
     create_sdk_mcp_server,
 )
 
+# ==============================================================================
+# Shared Helpers
+# ==============================================================================
+
+# Shared, read-only MCP server configs: one place to edit commands and env.
+MCP_CONFIGS: Mapping[str, dict] = MappingProxyType(
+    {
+        "filesystem": {
+            "command": "npx",
+            "args": ["-y", "@modelcontextprotocol/server-filesystem"],
+            "env": {"ALLOWED_PATHS": "/home/user/projects"},
+        },
+        "playwright": {
+            "command": "npx",
+            "args": ["-y", "@modelcontextprotocol/server-playwright"],
+        },
+        "database": {
+            "command": "npx",
+            "args": ["-y", "@modelcontextprotocol/server-postgres"],
+            "env": {"DATABASE_URL": "postgresql://localhost/mydb"},
+        },
+    }
+)
+
+# Category keywords compiled into one alternation per router, so a task is
+# scanned once instead of once per keyword. Group order is routing priority.
+_ROUTE_RE = re.compile(
+    r"(?P<browser>browser|web scraping)|(?P<filesystem>file|directory)|(?P<database>database|sql)",
+    re.IGNORECASE,
+)
+_ORCHESTRATOR_RE = re.compile(
+    r"(?P<browser>browser|web)|(?P<filesystem>file|directory)|(?P<database>database|sql)",
+    re.IGNORECASE,
+)
+
+
+@functools.lru_cache(maxsize=1024)
+def _classify(task_description: str, pattern: re.Pattern = _ORCHESTRATOR_RE) -> str:
+    """
+    Return the highest-priority category whose keywords appear in the task.
+
+    Cached because the same prompts are routed repeatedly in dev/test loops.
+    """
+    found = {match.lastgroup for match in pattern.finditer(task_description)}
+    return next((name for name in pattern.groupindex if name in found), "general")
+
+
+async def _collect(stream: AbstractAsyncContextManager[AsyncIterator[Message]]) -> list[Message]:
+    """Materialize a response stream for callers that need every message"""
+    async with stream as messages:
+        return [msg async for msg in messages]
+
+
+class _Session:
+    """A pooled client plus the lock that keeps one response stream on it at a time"""
+
+    def __init__(self, client: ClaudeSDKClient):
+        self.client = client
+        self._lock = anyio.Lock()
+        self._unfinished = False
+
+    async def _drain(self):
+        # Stop and read the rest of an abandoned response, up to its
+        # ResultMessage, so the next query() is not answered with the
+        # previous one's messages.
+        if self._unfinished:
+            await self.client.interrupt()
+            async for _ in self.client.receive_response():
+                pass
+            self._unfinished = False
+
+    async def _messages(self) -> AsyncIterator[Message]:
+        async for msg in self.client.receive_response():
+            yield msg
+        self._unfinished = False
+
+    @asynccontextmanager
+    async def stream(self, prompt: str) -> AsyncIterator[AsyncIterator[Message]]:
+        """
+        Send a prompt and stream its response:
+
+            async with session.stream(prompt) as messages:
+                async for msg in messages:
+                    ...
+
+        Each prompt runs in its own conversation on the shared client. The
+        session is held until the block exits, so overlapping callers
+        wait instead of interleaving. Callers may stop early: leaving the
+        block interrupts and drains what is left of the response. A cancelled
+        caller leaves straight away and the next stream() cleans up instead.
+        """
+        async with self._lock:
+            # A cancelled caller skipped its drain; finish it first
+            await self._drain()
+            # A fresh session per prompt, so tasks sharing a warm client don't
+            # inherit each other's transcript (or its token cost)
+            await self.client.query(prompt, session_id=f"task-{uuid.uuid4().hex}")
+            self._unfinished = True
+            messages = self._messages()
+            cancelled = False
+            try:
+                yield messages
+            except anyio.get_cancelled_exc_class():
+                # Don't hold a timeout up waiting on the model
+                cancelled = True
+                raise
+            finally:
+                if not cancelled:
+                    await messages.aclose()
+                    await self._drain()
+
+
+class ClientDaemon:
+    """
+    Process-wide pool of warm clients, shared by every orchestrator and
+    router in this interpreter.
+
+    Each ClaudeSDKClient spawns a Claude Code subprocess and starts its MCP
+    servers, so a client is started once per distinct configuration and
+    reused while the daemon runs. Each is wrapped in a _Session so callers
+    anywhere in the process take turns on it and an abandoned response is
+    drained before reuse.
+
+    The SDK's anyio task groups must be exited by the task that entered
+    them, so one daemon task starts and closes every client, serving
+    acquire() requests over a memory channel. acquire() may then be called
+    from any task inside:
+
+        async with ClientDaemon.running():
+            ...
+    """
+
+    _requests: ClassVar[MemoryObjectSendStream | None] = None
+
+    @staticmethod
+    def _key(options: ClaudeAgentOptions) -> str:
+        # Key on every option, including full server configs: two options
+        # that name the same server with different args or env, or differ in
+        # model, cwd or permissions, must not share a client. Values JSON
+        # can't encode (in-process servers, callbacks) fall back to repr(),
+        # which distinguishes them by identity.
+        return json.dumps(vars(options), sort_keys=True, default=repr)
+
+    @classmethod
+    @asynccontextmanager
+    async def running(cls) -> AsyncIterator[None]:
+        """Run the daemon task for the duration of the block"""
+        if cls._requests is not None:
+            raise RuntimeError("ClientDaemon is already running")
+        send, receive = anyio.create_memory_object_stream(math.inf)
+        stopped = anyio.Event()
+        async with anyio.create_task_group() as tg:
+            tg.start_soon(cls._serve, receive, stopped)
+            cls._requests = send
+            try:
+                yield
+            finally:
+                cls._requests = None
+                send.close()
+                # Let the daemon disconnect its clients before the task group
+                # exits, even if this block is unwinding from an error
+                with anyio.CancelScope(shield=True):
+                    await stopped.wait()
+
+    @classmethod
+    async def _serve(cls, requests: MemoryObjectReceiveStream, stopped: anyio.Event):
+        # Requests are served one at a time, so concurrent acquires for the
+        # same key can't both spawn a subprocess
+        sessions: dict[str, _Session] = {}
+        try:
+            async with AsyncExitStack() as stack, requests:
+                async for options, reply in requests:
+                    key = cls._key(options)
+                    try:
+                        if key not in sessions:
+                            client = ClaudeSDKClient(options=options)
+                            sessions[key] = _Session(await stack.enter_async_context(client))
+                        result = sessions[key]
+                    except Exception as exc:
+                        result = exc
+                    # The requester may have been cancelled and gone away
+                    with contextlib.suppress(anyio.BrokenResourceError):
+                        reply.send_nowait(result)
+                    reply.close()
+        finally:
+            stopped.set()
+
+    @classmethod
+    async def acquire(cls, options: ClaudeAgentOptions) -> _Session:
+        """Return a warm session for these options, starting one if needed"""
+        if cls._requests is None:
+            raise RuntimeError("ClientDaemon is not running; use `async with ClientDaemon.running()`")
+        reply_send, reply_receive = anyio.create_memory_object_stream(1)
+        await cls._requests.send((options, reply_send))
+        async with reply_receive:
+            result = await reply_receive.receive()
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+
 # ==============================================================================
 # Solution 1: Query-Level Isolation (RECOMMENDED)
 # ==============================================================================
 
+# Per-category options don't depend on the task, so they are built once at
+# import time rather than on every route_task call.
+_BROWSER_OPTIONS = ClaudeAgentOptions(
+    mcp_servers={"playwright": MCP_CONFIGS["playwright"]},
+    system_prompt="You are a browser automation specialist.",
+)
+
+_FILESYSTEM_OPTIONS = ClaudeAgentOptions(
+    mcp_servers={"filesystem": MCP_CONFIGS["filesystem"]},
+    system_prompt="You are a file operations specialist.",
+)
+
+_DATABASE_OPTIONS = ClaudeAgentOptions(
+    mcp_servers={"database": MCP_CONFIGS["database"]},
+    system_prompt="You are a database specialist.",
+)
+
+_GENERAL_OPTIONS = ClaudeAgentOptions(
+    mcp_servers={},
+    allowed_tools=["Read", "Write", "Bash"],
+)
+
+_OPTIONS_BY_CATEGORY = {
+    "browser": _BROWSER_OPTIONS,
+    "filesystem": _FILESYSTEM_OPTIONS,
+    "database": _DATABASE_OPTIONS,
+    "general": _GENERAL_OPTIONS,
+}
+
 
 async def solution1_query_level_isolation():
     """
@@ -27,71 +271,36 @@ async def solution1_query_level_isolation():
     """
     print("=== Solution 1: Query-Level Isolation ===\n")
 
-    # Define MCP server configs
-    filesystem_config = {
-        "command": "npx",
-        "args": ["-y", "@modelcontextprotocol/server-filesystem"],
-        "env": {"ALLOWED_PATHS": "/home/user/projects"},
-    }
-
-    playwright_config = {
-        "command": "npx",
-        "args": ["-y", "@modelcontextprotocol/server-playwright"],
-    }
-
-    database_config = {
-        "command": "npx",
-        "args": ["-y", "@modelcontextprotocol/server-postgres"],
-        "env": {"DATABASE_URL": "postgresql://localhost/mydb"},
-    }
+    @asynccontextmanager
+    async def route_task(task_description: str) -> AsyncIterator[AsyncIterator[Message]]:
+        """
+        Route tasks to appropriate isolated query based on requirements.
 
-    async def route_task(task_description: str):
-        """Route tasks to appropriate isolated query based on requirements"""
-        task_lower = task_description.lower()
+        Use as an async context manager yielding the response stream; the
+        category's client is held until the block exits.
+        """
+        category = _classify(task_description, _ROUTE_RE)
 
         # Route to browser automation agent
-        if "browser" in task_lower or "web scraping" in task_lower:
+        if category == "browser":
             print("→ Routing to Browser Agent (Playwright only)\n")
-            options = ClaudeAgentOptions(
-                mcp_servers={"playwright": playwright_config},
-                system_prompt="You are a browser automation specialist.",
-            )
-            async with ClaudeSDKClient(options=options) as client:
-                await client.query(task_description)
-                return [msg async for msg in client.receive_response()]
 
         # Route to file processing agent
-        elif "file" in task_lower or "directory" in task_lower:
+        elif category == "filesystem":
             print("→ Routing to File Agent (Filesystem only)\n")
-            options = ClaudeAgentOptions(
-                mcp_servers={"filesystem": filesystem_config},
-                system_prompt="You are a file operations specialist.",
-            )
-            async with ClaudeSDKClient(options=options) as client:
-                await client.query(task_description)
-                return [msg async for msg in client.receive_response()]
 
         # Route to database agent
-        elif "database" in task_lower or "sql" in task_lower:
+        elif category == "database":
             print("→ Routing to Database Agent (Database only)\n")
-            options = ClaudeAgentOptions(
-                mcp_servers={"database": database_config},
-                system_prompt="You are a database specialist.",
-            )
-            async with ClaudeSDKClient(options=options) as client:
-                await client.query(task_description)
-                return [msg async for msg in client.receive_response()]
 
         # Default: general agent with minimal tools
         else:
             print("→ Routing to General Agent (no MCP servers)\n")
-            options = ClaudeAgentOptions(
-                mcp_servers={},
-                allowed_tools=["Read", "Write", "Bash"],
-            )
-            async with ClaudeSDKClient(options=options) as client:
-                await client.query(task_description)
-                return [msg async for msg in client.receive_response()]
+
+        # Warm clients are pooled per category by ClientDaemon
+        session = await ClientDaemon.acquire(_OPTIONS_BY_CATEGORY[category])
+        async with session.stream(task_description) as messages:
+            yield messages
 
     # Example usage
     tasks = [
@@ -103,7 +312,10 @@ async def solution1_query_level_isolation():
 
     for task in tasks:
         print(f'Task: "{task}"')
-        await route_task(task)
+        async with route_task(task) as messages:
+            async for message in messages:
+                # Process messages...
+                pass
         print()
 
 
@@ -124,15 +336,8 @@ async def solution2_tool_allowlisting():
     # All MCP servers configured (shared by everyone)
     options = ClaudeAgentOptions(
         mcp_servers={
-            "playwright": {
-                "command": "npx",
-                "args": ["-y", "@modelcontextprotocol/server-playwright"],
-            },
-            "filesystem": {
-                "command": "npx",
-                "args": ["-y", "@modelcontextprotocol/server-filesystem"],
-                "env": {"ALLOWED_PATHS": "/home/user/projects"},
-            },
+            "playwright": MCP_CONFIGS["playwright"],
+            "filesystem": MCP_CONFIGS["filesystem"],
         },
         # Main agent's allowed tools - Playwright excluded
         allowed_tools=[
@@ -158,6 +363,48 @@ async def solution2_tool_allowlisting():
 # Solution 3: In-Process SDK MCP Servers
 # ==============================================================================
 
+# Tools and servers are static, so they are created once per process
+@tool("analyze_code", "Analyze code for patterns and issues", {"file_path": str, "check_type": str})
+async def analyze_code(args):
+    file_path = args["file_path"]
+    check_type = args["check_type"]
+    # Custom analysis logic here
+    return {
+        "content": [
+            {
+                "type": "text",
+                "text": f"Analyzed {file_path} for {check_type} issues: Found 0 critical issues.",
+            }
+        ]
+    }
+
+
+@tool("generate_docs", "Generate documentation from code", {"file_path": str, "format": str})
+async def generate_docs(args):
+    file_path = args["file_path"]
+    doc_format = args["format"]
+    # Doc generation logic here
+    return {"content": [{"type": "text", "text": f"Generated {doc_format} documentation for {file_path}"}]}
+
+
+# Create SDK MCP servers
+_CODE_TOOLS_SERVER = create_sdk_mcp_server(name="code-tools", version="1.0.0", tools=[analyze_code])
+
+_DOCS_TOOLS_SERVER = create_sdk_mcp_server(name="docs-tools", version="1.0.0", tools=[generate_docs])
+
+_CODE_OPTIONS = ClaudeAgentOptions(
+    mcp_servers={
+        "code-tools": _CODE_TOOLS_SERVER,
+        "docs-tools": _DOCS_TOOLS_SERVER,
+    },
+    allowed_tools=[
+        "Read",
+        "Grep",
+        "mcp__code-tools__analyze_code",
+        "mcp__docs-tools__generate_docs",
+    ],
+)
+
 
 async def solution3_inprocess_mcp_servers():
     """
@@ -168,47 +415,7 @@ async def solution3_inprocess_mcp_servers():
     """
     print("=== Solution 3: In-Process SDK MCP Servers ===\n")
 
-    # Create custom tools
-    @tool("analyze_code", "Analyze code for patterns and issues", {"file_path": str, "check_type": str})
-    async def analyze_code(args):
-        file_path = args["file_path"]
-        check_type = args["check_type"]
-        # Custom analysis logic here
-        return {
-            "content": [
-                {
-                    "type": "text",
-                    "text": f"Analyzed {file_path} for {check_type} issues: Found 0 critical issues.",
-                }
-            ]
-        }
-
-    @tool("generate_docs", "Generate documentation from code", {"file_path": str, "format": str})
-    async def generate_docs(args):
-        file_path = args["file_path"]
-        doc_format = args["format"]
-        # Doc generation logic here
-        return {"content": [{"type": "text", "text": f"Generated {doc_format} documentation for {file_path}"}]}
-
-    # Create SDK MCP servers
-    code_tools_server = create_sdk_mcp_server(name="code-tools", version="1.0.0", tools=[analyze_code])
-
-    docs_tools_server = create_sdk_mcp_server(name="docs-tools", version="1.0.0", tools=[generate_docs])
-
-    options = ClaudeAgentOptions(
-        mcp_servers={
-            "code-tools": code_tools_server,
-            "docs-tools": docs_tools_server,
-        },
-        allowed_tools=[
-            "Read",
-            "Grep",
-            "mcp__code-tools__analyze_code",
-            "mcp__docs-tools__generate_docs",
-        ],
-    )
-
-    async with ClaudeSDKClient(options=options) as client:
+    async with ClaudeSDKClient(options=_CODE_OPTIONS) as client:
         await client.query("Analyze and document the authentication module")
 
         async for message in client.receive_response():
@@ -225,112 +432,158 @@ class AgentOrchestrator:
     """
     Build a sophisticated orchestrator that analyzes tasks and routes to
     appropriate isolated query invocations.
+
+    Use as an async context manager inside ClientDaemon.running(): one
+    client per category is acquired from ClientDaemon on entry (or on first
+    use with prewarm=False). The clients outlive the orchestrator, so later
+    instances start warm.
+
+    execute_task may be called concurrently: tasks in the same category
+    share a client and take turns on it, while other categories proceed.
     """
 
-    def __init__(self):
-        self.browser_config = {
-            "command": "npx",
-            "args": ["-y", "@modelcontextprotocol/server-playwright"],
-        }
+    # Read-only records: analyze_task hands these out shared, not copied
+    _CATEGORY_TABLE = {
+        "browser": MappingProxyType({"category": "browser", "complexity": "complex", "tools": ("playwright",)}),
+        "filesystem": MappingProxyType({"category": "filesystem", "complexity": "simple", "tools": ("filesystem",)}),
+        "database": MappingProxyType({"category": "database", "complexity": "complex", "tools": ("database",)}),
+        "general": MappingProxyType({"category": "general", "complexity": "simple", "tools": ()}),
+    }
 
-        self.filesystem_config = {
-            "command": "npx",
-            "args": ["-y", "@modelcontextprotocol/server-filesystem"],
-            "env": {"ALLOWED_PATHS": "/home/user/projects"},
-        }
+    _OPTIONS_BY_CATEGORY = {
+        "browser": ClaudeAgentOptions(
+            mcp_servers={"playwright": MCP_CONFIGS["playwright"]},
+            system_prompt="You are a browser automation expert.",
+        ),
+        "filesystem": ClaudeAgentOptions(
+            mcp_servers={"filesystem": MCP_CONFIGS["filesystem"]},
+            system_prompt="You are a file operations expert.",
+        ),
+        "database": ClaudeAgentOptions(
+            mcp_servers={"database": MCP_CONFIGS["database"]},
+            system_prompt="You are a database expert.",
+        ),
+        "general": ClaudeAgentOptions(
+            mcp_servers={},
+            allowed_tools=["Read", "Write", "Bash", "Grep", "Glob"],
+            system_prompt="You are a helpful assistant.",
+        ),
+    }
 
-        self.database_config = {
-            "command": "npx",
-            "args": ["-y", "@modelcontextprotocol/server-postgres"],
-            "env": {"DATABASE_URL": "postgresql://localhost/mydb"},
+    def __init__(self, prewarm: bool = True):
+        self.prewarm = prewarm
+
+        self._sessions: dict[str, _Session] = {}
+
+        # Category -> bound handler. A new category also needs a
+        # _CATEGORY_TABLE record, an _OPTIONS_BY_CATEGORY entry and a named
+        # group in _ORCHESTRATOR_RE.
+        self._dispatch = {
+            "browser": self._execute_browser_task,
+            "filesystem": self._execute_filesystem_task,
+            "database": self._execute_database_task,
+            "general": self._execute_general_task,
         }
 
-    def analyze_task(self, task_description: str) -> dict:
+    async def __aenter__(self):
+        if self.prewarm:
+            for category in self._CATEGORY_TABLE:
+                await self._warm(category)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        # Clients stay pooled in ClientDaemon; only drop our references
+        self._sessions.clear()
+
+    async def _get_session(self, category: str) -> _Session:
+        """Return the warm session for a category, starting it on first use"""
+        if category not in self._sessions:
+            self._sessions[category] = await ClientDaemon.acquire(self._OPTIONS_BY_CATEGORY[category])
+        return self._sessions[category]
+
+    async def _warm(self, category: str):
+        """Start a category's client ahead of its first task"""
+        # Acquiring is the whole warm-up: connecting spawns the CLI and
+        # completes the initialize handshake, which starts the MCP servers.
+        await self._get_session(category)
+
+    def analyze_task(self, task_description: str) -> Mapping:
         """Analyze task to determine required capabilities"""
-        lower = task_description.lower()
-
-        if "browser" in lower or "web" in lower:
-            return {"category": "browser", "complexity": "complex", "tools": ["playwright"]}
-        if "file" in lower or "directory" in lower:
-            return {"category": "filesystem", "complexity": "simple", "tools": ["filesystem"]}
-        if "database" in lower or "sql" in lower:
-            return {"category": "database", "complexity": "complex", "tools": ["database"]}
+        return self._CATEGORY_TABLE[_classify(task_description)]
 
-        return {"category": "general", "complexity": "simple", "tools": []}
+    @asynccontextmanager
+    async def execute_task(self, task_description: str) -> AsyncIterator[AsyncIterator[Message]]:
+        """
+        Execute task with appropriate isolated MCP configuration.
 
-    async def execute_task(self, task_description: str):
-        """Execute task with appropriate isolated MCP configuration"""
+        Use as an async context manager yielding the response stream; the
+        category's client is held until the block exits.
+        """
         task_type = self.analyze_task(task_description)
 
         print(f"Task Type: {task_type['category']} ({task_type['complexity']})")
         print(f"Required Tools: {', '.join(task_type['tools']) or 'none'}\n")
 
-        category = task_type["category"]
-
-        if category == "browser":
-            return await self._execute_browser_task(task_description)
-        elif category == "filesystem":
-            return await self._execute_filesystem_task(task_description)
-        elif category == "database":
-            return await self._execute_database_task(task_description)
-        else:
-            return await self._execute_general_task(task_description)
+        handler = self._dispatch.get(task_type["category"], self._execute_general_task)
+        async with handler(task_description) as messages:
+            yield messages
 
-    async def _execute_browser_task(self, prompt: str):
+    @asynccontextmanager
+    async def _execute_browser_task(self, prompt: str) -> AsyncIterator[AsyncIterator[Message]]:
         print("→ Executing with Browser Agent (Playwright isolated)\n")
-        options = ClaudeAgentOptions(
-            mcp_servers={"playwright": self.browser_config},
-            system_prompt="You are a browser automation expert.",
-        )
-        async with ClaudeSDKClient(options=options) as client:
-            await client.query(prompt)
-            return [msg async for msg in client.receive_response()]
+        session = await self._get_session("browser")
+        async with session.stream(prompt) as messages:
+            yield messages
 
-    async def _execute_filesystem_task(self, prompt: str):
+    @asynccontextmanager
+    async def _execute_filesystem_task(self, prompt: str) -> AsyncIterator[AsyncIterator[Message]]:
         print("→ Executing with Filesystem Agent (Filesystem isolated)\n")
-        options = ClaudeAgentOptions(
-            mcp_servers={"filesystem": self.filesystem_config},
-            system_prompt="You are a file operations expert.",
-        )
-        async with ClaudeSDKClient(options=options) as client:
-            await client.query(prompt)
-            return [msg async for msg in client.receive_response()]
+        session = await self._get_session("filesystem")
+        async with session.stream(prompt) as messages:
+            yield messages
 
-    async def _execute_database_task(self, prompt: str):
+    @asynccontextmanager
+    async def _execute_database_task(self, prompt: str) -> AsyncIterator[AsyncIterator[Message]]:
         print("→ Executing with Database Agent (Database isolated)\n")
-        options = ClaudeAgentOptions(
-            mcp_servers={"database": self.database_config},
-            system_prompt="You are a database expert.",
-        )
-        async with ClaudeSDKClient(options=options) as client:
-            await client.query(prompt)
-            return [msg async for msg in client.receive_response()]
+        session = await self._get_session("database")
+        async with session.stream(prompt) as messages:
+            yield messages
 
-    async def _execute_general_task(self, prompt: str):
+    @asynccontextmanager
+    async def _execute_general_task(self, prompt: str) -> AsyncIterator[AsyncIterator[Message]]:
         print("→ Executing with General Agent (No MCP servers)\n")
-        options = ClaudeAgentOptions(
-            mcp_servers={},
-            allowed_tools=["Read", "Write", "Bash", "Grep", "Glob"],
-            system_prompt="You are a helpful assistant.",
-        )
-        async with ClaudeSDKClient(options=options) as client:
-            await client.query(prompt)
-            return [msg async for msg in client.receive_response()]
+        session = await self._get_session("general")
+        async with session.stream(prompt) as messages:
+            yield messages
+
+    async def _run_bucket(self, category: str, bucket: list[tuple[int, str]], results: list):
+        """Pipeline one category's tasks back-to-back through its handler"""
+        task_type = self._CATEGORY_TABLE[category]
+        print(f"Batch: {len(bucket)} {category} task(s) ({task_type['complexity']})")
+        print(f"Required Tools: {', '.join(task_type['tools']) or 'none'}\n")
+
+        handler = self._dispatch[category]
+        for index, task in bucket:
+            results[index] = await _collect(handler(task))
 
     async def execute_multiple_tasks(self, tasks: list[str]):
-        """Execute multiple tasks in sequence"""
-        results = []
-        for task in tasks:
-            result = await self.execute_task(task)
-            results.append(result)
+        """Execute multiple tasks, batched by category and run concurrently"""
+        buckets = defaultdict(list)
+        for index, task in enumerate(tasks):
+            buckets[self.analyze_task(task)["category"]].append((index, task))
+
+        # A task group cancels the other buckets if one fails, instead of
+        # leaving them running against clients that are being shut down
+        results = [None] * len(tasks)
+        async with anyio.create_task_group() as tg:
+            for category, bucket in buckets.items():
+                tg.start_soon(self._run_bucket, category, bucket, results)
         return results
 
 
 async def solution4_external_orchestrator():
     print("=== Solution 4: External Orchestrator Pattern ===\n")
 
-    orchestrator = AgentOrchestrator()
-
     tasks = [
         "Scrape pricing data from competitors' websites",
         "List all markdown files in docs/",
@@ -338,7 +591,8 @@ async def solution4_external_orchestrator():
         "Explain the difference between async and sync functions",
     ]
 
-    await orchestrator.execute_multiple_tasks(tasks)
+    async with AgentOrchestrator() as orchestrator:
+        await orchestrator.execute_multiple_tasks(tasks)
 
 
 # ==============================================================================
@@ -366,9 +620,9 @@ async def compare_approaches():
         system_prompt="Process files only",
     )
 
-    async with ClaudeSDKClient(options=options) as client:
-        await client.query("Process files")
-        # Will only see filesystem MCP server
+    # The isolation is visible in the options alone; starting a client here
+    # would only pay SDK startup for nothing.
+    assert list(options.mcp_servers.keys()) == ["filesystem"]
 
     print("→ Agent only sees filesystem MCP server")
     print("→ Context includes only filesystem tools (no wasted tokens)\n")
@@ -383,14 +637,24 @@ async def main():
     print("Claude Code SDK: MCP Subagent Isolation Solutions (Python)\n")
     print("=" * 70 + "\n")
 
-    # Uncomment to run specific solutions:
+    # Pooled clients live until the daemon block exits
+    async with ClientDaemon.running():
+        # Uncomment to run specific solutions:
 
-    # await solution1_query_level_isolation()
-    # await solution2_tool_allowlisting()
-    # await solution3_inprocess_mcp_servers()
-    # await solution4_external_orchestrator()
-    # await compare_approaches()
+        # await solution1_query_level_isolation()
+        # await solution2_tool_allowlisting()
+        # await solution3_inprocess_mcp_servers()
+        # await solution4_external_orchestrator()
+        # await compare_approaches()
+        pass
 
 
 if __name__ == "__main__":
-    anyio.run(main)
+    # uvloop lowers per-event overhead for the many small MCP/stdio reads;
+    # it is optional and unavailable on Windows, so fall back to asyncio.
+    try:
+        import uvloop  # noqa: F401
+    except ImportError:
+        anyio.run(main)
+    else:
+        anyio.run(main, backend="asyncio", backend_options={"use_uvloop": True})